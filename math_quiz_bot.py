@@ -1,10 +1,16 @@
 import logging
+import operator
 import random
 import time
 import asyncio
+import heapq
 import os
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -26,57 +32,84 @@ DEFAULT_TIMEOUT_PER_Q = 20  # seconds
 POINTS_CORRECT = 100
 POINTS_PER_SECOND_SPEED_BONUS_MAX = 50  # Max bonus for answering instantly
 STREAK_BONUS_PER_LEVEL = 10
+ADMIN_CACHE_TTL = 60  # seconds
+ADMIN_CACHE_MAX_SIZE = 1024
 
-CHEERING_QUOTES = [
+OPS = {'+': operator.add, '-': operator.sub}
+OPERATORS = tuple(OPS)
+
+CHEERING_QUOTES = (
     "Victory is sweetest when you've known defeat.",
     "A champion is afraid of losing. Everyone else is afraid of winning.",
     "The harder the battle, the sweeter the victory.",
     "You are a true champion! Well played!",
     "In the arena of quiz, you are the gladiator!",
     "Your mind is a finely-tuned weapon! Congratulations!",
-]
+)
+
+PLACING_EMOJIS = ("🥇", "🥈", "🥉")
+
+# --- Setup Keyboards ---
+DIFFICULTY_MARKUP = InlineKeyboardMarkup((
+    (InlineKeyboardButton("😄 Easy", callback_data="config:difficulty:easy"),),
+    (InlineKeyboardButton("🤔 Medium", callback_data="config:difficulty:medium"),),
+    (InlineKeyboardButton("🤯 Hard", callback_data="config:difficulty:hard"),),
+    (InlineKeyboardButton("❌ Cancel", callback_data="config:cancel:setup"),),
+))
+
+QUESTIONS_MARKUP = InlineKeyboardMarkup((
+    (
+        InlineKeyboardButton("5", callback_data="config:questions:5"),
+        InlineKeyboardButton("10", callback_data="config:questions:10"),
+        InlineKeyboardButton("15", callback_data="config:questions:15"),
+        InlineKeyboardButton("20", callback_data="config:questions:20"),
+    ),
+    (InlineKeyboardButton("🔙 Back to Difficulty", callback_data="config:back:main"),),
+))
 
 # --- Game State ---
-quizzes = {}  # group_id -> quiz_data
-# quiz_data structure:
-# {
-#     "status": str, # "configuring", "active", "stopped"
-#     "host_id": int,
-#     "config": {"difficulty": str, "num_questions": int},
-#     "active": bool,
-#     "questions_data": list_of_question_dicts,
-#     "current_q_index": int,
-#     "current_question_details": dict, # {'text': str, 'answer': int}
-#     "q_start_time": float,
-#     "first_answerer_id": int, # User ID of the person who answered correctly first
-#     "scores": {user_id: {"points": int, "streak": int, "username": str}},
-#     "current_question_event": asyncio.Event,
-#     "setup_message_id": int,
-# }
+@dataclass(slots=True)
+class PlayerScore:
+    points: int = 0
+    streak: int = 0
+    streak_epoch: int = -1  # Epoch in which the current streak was last extended
+    username: str = ""
+
+
+@dataclass(slots=True)
+class Quiz:
+    host_id: int
+    status: str = "configuring"  # "configuring", "active", "stopped"
+    config: dict = field(default_factory=dict)  # {"difficulty": str, "num_questions": int}
+    active: bool = False  # Not active until fully configured
+    questions_data: list = field(default_factory=list)
+    current_q_index: int = -1
+    current_question_details: dict | None = None  # {'text': str, 'answer': int}
+    q_start_time: float | None = None
+    first_answerer_id: int | None = None  # User ID of the person who answered correctly first
+    scores: dict[int, PlayerScore] = field(default_factory=dict)
+    streak_epoch: int = 0  # Bumped once per question; a streak only counts if earned in the current epoch
+    current_question_future: asyncio.Future | None = None  # Resolved with the winner's ID, or None when stopped
+    setup_message_id: int | None = None
+    last_setup_edit: tuple | None = None  # (message_id, text, reply_markup) last shown, to skip no-op edits
+
+
+quizzes: dict[int, Quiz] = {}  # group_id -> Quiz
+_admin_cache: dict[tuple[int, int], tuple[float, bool]] = {}  # (chat_id, user_id) -> (checked_at, is_admin)
 
 
 # --- Question Generation ---
-def generate_math_question(difficulty: str) -> dict:
-    """Generates a math question with three numbers and two operators (+, -)."""
-    if difficulty == "easy":
-        nums = [random.randint(1, 25) for _ in range(3)]
-    elif difficulty == "medium":
-        nums = [random.randint(10, 75) for _ in range(3)]
-    else:  # hard
-        nums = [random.randint(20, 150) for _ in range(3)]
-
-    ops = [random.choice(['+', '-']) for _ in range(2)]
-    expression = f"{nums[0]} {ops[0]} {nums[1]} {ops[1]} {nums[2]}"
+NUM_RANGES = {
+    "easy": range(1, 26),
+    "medium": range(10, 76),
+    "hard": range(20, 151),
+}
 
-    # Safely evaluate the expression
-    try:
-        answer = eval(expression)
-    except Exception as e:
-        logger.error(f"Failed to evaluate expression '{expression}': {e}")
-        # Fallback to a simpler, guaranteed-to-work expression
-        nums = [random.randint(10, 50) for _ in range(2)]
-        expression = f"{nums[0]} + {nums[1]}"
-        answer = nums[0] + nums[1]
+
+def _build_question(nums, ops, difficulty: str) -> dict:
+    """Formats three numbers and two operators into a question dict."""
+    expression = f"{nums[0]} {ops[0]} {nums[1]} {ops[1]} {nums[2]}"
+    answer = OPS[ops[1]](OPS[ops[0]](nums[0], nums[1]), nums[2])
 
     return {
         "text": f"What is {expression}?",
@@ -86,38 +119,44 @@ def generate_math_question(difficulty: str) -> dict:
     }
 
 
+def generate_math_questions(difficulty: str, count: int) -> list:
+    """Generates math questions with three numbers and two operators (+, -) each.
+
+    All numbers and operators for the batch are drawn in one go.
+    """
+    nums = random.choices(NUM_RANGES.get(difficulty, NUM_RANGES["hard"]), k=count * 3)
+    ops = random.choices(OPERATORS, k=count * 2)
+    return [
+        _build_question(nums[i * 3:i * 3 + 3], ops[i * 2:i * 2 + 2], difficulty)
+        for i in range(count)
+    ]
+
+
 # --- Command Handlers ---
 async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Starts the interactive quiz setup process."""
     group_id = update.effective_chat.id
     user = update.effective_user
 
-    if group_id in quizzes and quizzes[group_id].get("active"):
+    if group_id in quizzes and quizzes[group_id].active:
         await update.message.reply_text("⏳ A quiz is already running in this group!")
         return
 
     # Initialize a new quiz in 'configuring' state
-    quizzes[group_id] = {
-        "status": "configuring",
-        "host_id": user.id,
-        "config": {},
-        "active": False, # Not active until fully configured
-    }
+    quizzes[group_id] = Quiz(host_id=user.id)
+
+    text = _welcome_text(user.first_name)
+    msg = await update.message.reply_text(text, reply_markup=DIFFICULTY_MARKUP)
+    quizzes[group_id].setup_message_id = msg.message_id
+    quizzes[group_id].last_setup_edit = (msg.message_id, text, DIFFICULTY_MARKUP)
 
-    keyboard = [
-        [InlineKeyboardButton("😄 Easy", callback_data="config:difficulty:easy")],
-        [InlineKeyboardButton("🤔 Medium", callback_data="config:difficulty:medium")],
-        [InlineKeyboardButton("🤯 Hard", callback_data="config:difficulty:hard")],
-        [InlineKeyboardButton("❌ Cancel", callback_data="config:cancel:setup")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
 
-    msg = await update.message.reply_text(
-        f"👋 Welcome, {user.first_name}!\n\n"
-        "Let's set up a new quiz. First, choose the difficulty:",
-        reply_markup=reply_markup
+def _welcome_text(first_name: str) -> str:
+    """Builds the greeting shown on the difficulty selection step."""
+    return (
+        f"👋 Welcome, {first_name}!\n\n"
+        "Let's set up a new quiz. First, choose the difficulty:"
     )
-    quizzes[group_id]["setup_message_id"] = msg.message_id
 
 
 async def stop_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -131,25 +170,24 @@ async def stop_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     is_admin = await _is_admin(update, context)
-    if user_id != quiz.get("host_id") and not is_admin:
+    if user_id != quiz.host_id and not is_admin:
         await update.message.reply_text("Only the quiz host or a group admin can stop the quiz.")
         return
 
-    quiz["active"] = False
-    quiz["status"] = "stopped"
-    if quiz.get("current_question_event"):
-        quiz["current_question_event"].set()
+    quiz.active = False
+    quiz.status = "stopped"
+    if quiz.current_question_future and not quiz.current_question_future.done():
+        quiz.current_question_future.set_result(None)
 
     stopper_name = update.effective_user.first_name
     await context.bot.send_message(chat_id=group_id, text=f"🚨 Quiz stopped by {stopper_name}.")
 
     # If quiz was active, show final scores. Otherwise, just clean up.
-    if quiz.get("scores"):
+    if quiz.scores:
         await show_leaderboard(group_id, context, final=True)
 
-    if group_id in quizzes:
-        del quizzes[group_id]
-    logger.info(f"Quiz {group_id} stopped and data cleaned up.")
+    quizzes.pop(group_id, None)
+    logger.info("Quiz %d stopped and data cleaned up.", group_id)
 
 
 # --- Callback Handler for Setup ---
@@ -162,71 +200,97 @@ async def handle_config_callback(update: Update, context: ContextTypes.DEFAULT_T
     user_id = query.from_user.id
     quiz = quizzes.get(group_id)
 
-    if not quiz or user_id != quiz.get("host_id"):
+    if not quiz or user_id != quiz.host_id:
         await context.bot.send_message(
             chat_id=user_id,
             text="Only the person who started the quiz can configure it."
         )
         return
 
-    if quiz.get("status") != "configuring":
-        await query.edit_message_text("Configuration is already complete or has been cancelled.")
+    if quiz.status != "configuring":
+        await safe_edit(query, quiz, "Configuration is already complete or has been cancelled.")
         return
 
-    _, config_type, config_value = query.data.split(':')
+    _, config_type, config_value = query.data.split(':', 2)
 
-    if config_type == "cancel":
-        del quizzes[group_id]
-        await query.edit_message_text("Quiz setup cancelled. 👋")
+    try:
+        handler = CONFIG_DISPATCH[config_type]
+    except KeyError:
+        logger.warning("Unknown config callback type %r in chat %d", config_type, group_id)
         return
+    await handler(query, quiz, config_value, context)
 
-    if config_type == "difficulty":
-        quiz["config"]["difficulty"] = config_value
-        keyboard = [
-            [
-                InlineKeyboardButton("5", callback_data="config:questions:5"),
-                InlineKeyboardButton("10", callback_data="config:questions:10"),
-                InlineKeyboardButton("15", callback_data="config:questions:15"),
-                InlineKeyboardButton("20", callback_data="config:questions:20"),
-            ],
-            [InlineKeyboardButton("🔙 Back to Difficulty", callback_data="config:back:main")],
-        ]
-        await query.edit_message_text(
-            f"Difficulty set to: *{config_value.capitalize()}*\n\nNow, how many questions?",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode=ParseMode.MARKDOWN
-        )
 
-    elif config_type == "questions":
-        quiz["config"]["num_questions"] = int(config_value)
-        difficulty = quiz['config']['difficulty']
-        num_questions = quiz['config']['num_questions']
-
-        # Finalize setup and start the quiz
-        quiz.update({
-            "status": "active",
-            "active": True,
-            "questions_data": [generate_math_question(difficulty) for _ in range(num_questions)],
-            "current_q_index": -1,
-            "scores": {},
-            "current_question_event": asyncio.Event(),
-        })
-
-        await query.edit_message_text(
-            f"✅ *Quiz Setup Complete!*\n\n"
-            f"  - *Difficulty:* {difficulty.capitalize()}\n"
-            f"  - *Questions:* {num_questions}\n\n"
-            "Get ready to type your answers! The first correct response wins the round.",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        await asyncio.sleep(3)
-        context.application.create_task(run_quiz_loop(group_id, context))
+async def _handle_cancel(query, quiz: Quiz, config_value: str, context: ContextTypes.DEFAULT_TYPE):
+    """Cancels the quiz setup."""
+    quizzes.pop(query.message.chat_id, None)
+    await safe_edit(query, quiz, "Quiz setup cancelled. 👋")
+
 
-    elif config_type == "back":
-        # Go back to difficulty selection
-        await quiz_command(query, context) # Re-trigger the initial setup message
-        await query.message.delete() # Delete the old message
+async def _handle_difficulty(query, quiz: Quiz, config_value: str, context: ContextTypes.DEFAULT_TYPE):
+    """Stores the chosen difficulty and asks for the number of questions."""
+    quiz.config["difficulty"] = config_value
+    await safe_edit(
+        query, quiz,
+        f"Difficulty set to: *{config_value.capitalize()}*\n\nNow, how many questions?",
+        reply_markup=QUESTIONS_MARKUP,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+async def _handle_questions(query, quiz: Quiz, config_value: str, context: ContextTypes.DEFAULT_TYPE):
+    """Stores the number of questions, finalizes setup and starts the quiz."""
+    group_id = query.message.chat_id
+    quiz.config["num_questions"] = int(config_value)
+    difficulty = quiz.config['difficulty']
+    num_questions = quiz.config['num_questions']
+
+    # Finalize setup and start the quiz
+    quiz.status = "active"
+    quiz.active = True
+    quiz.questions_data = generate_math_questions(difficulty, num_questions)
+    quiz.current_q_index = -1
+    quiz.scores = {}
+    quiz.streak_epoch = 0
+
+    await safe_edit(
+        query, quiz,
+        f"✅ *Quiz Setup Complete!*\n\n"
+        f"  - *Difficulty:* {difficulty.capitalize()}\n"
+        f"  - *Questions:* {num_questions}\n\n"
+        "Get ready to type your answers! The first correct response wins the round.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+    await asyncio.sleep(3)
+    context.application.create_task(run_quiz_loop(group_id, context))
+
+
+async def _handle_back(query, quiz: Quiz, config_value: str, context: ContextTypes.DEFAULT_TYPE):
+    """Goes back to difficulty selection by editing the setup message in place."""
+    await safe_edit(query, quiz, _welcome_text(query.from_user.first_name), reply_markup=DIFFICULTY_MARKUP)
+
+
+CONFIG_DISPATCH = {
+    "difficulty": _handle_difficulty,
+    "questions": _handle_questions,
+    "cancel": _handle_cancel,
+    "back": _handle_back,
+}
+
+
+async def safe_edit(query, quiz: Quiz | None, text: str, **kwargs):
+    """Edits the setup message, skipping the API call if its content would not change."""
+    edit = (query.message.message_id, text, kwargs.get("reply_markup"))
+    if quiz is not None and quiz.last_setup_edit == edit:
+        return
+    try:
+        await query.edit_message_text(text, **kwargs)
+    except BadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            raise
+    if quiz is not None:
+        quiz.last_setup_edit = edit
 
 
 # --- Message Handler for Answers ---
@@ -236,54 +300,58 @@ async def handle_text_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_user.id
     quiz = quizzes.get(group_id)
 
-    # Filter out irrelevant messages
-    if (not quiz or not quiz.get("active") or
-            quiz.get("first_answerer_id") is not None or
-            not quiz.get("q_start_time")):
+    # Filter out irrelevant messages. The first_answerer_id check below and the write
+    # that locks the question have no await between them, so two simultaneous correct
+    # answers cannot both score.
+    if (not quiz or not quiz.active or
+            quiz.first_answerer_id is not None or
+            not quiz.q_start_time or
+            quiz.current_question_future.done()):
         return
 
-    try:
-        user_answer = int(update.message.text.strip())
-    except (ValueError, TypeError):
-        return  # Message is not a number, so ignore it as an answer
+    # The handler's regex filter guarantees the message is a small integer
+    user_answer = int(update.message.text.strip())
 
-    correct_answer = quiz["current_question_details"]["answer"]
+    correct_answer = quiz.current_question_details["answer"]
 
     if user_answer == correct_answer:
-        time_taken = time.time() - quiz["q_start_time"]
-        quiz["first_answerer_id"] = user_id  # Lock the question!
+        quiz.first_answerer_id = user_id  # Lock the question!
+        # Hold on to this question's Future: by the time the reply below is sent the
+        # loop may already have moved on to the next question.
+        question_future = quiz.current_question_future
+        time_taken = time.time() - quiz.q_start_time
 
         username = update.effective_user.first_name
-        if user_id not in quiz["scores"]:
-            quiz["scores"][user_id] = {"points": 0, "streak": 0, "username": username}
-        quiz["scores"][user_id]["username"] = username
+        entry = quiz.scores.setdefault(user_id, PlayerScore())
+        entry.username = username
 
         # Calculate points
         time_bonus_factor = max(0, (DEFAULT_TIMEOUT_PER_Q - time_taken) / DEFAULT_TIMEOUT_PER_Q)
         speed_bonus = int(POINTS_PER_SECOND_SPEED_BONUS_MAX * time_bonus_factor)
         
-        current_streak = quiz["scores"][user_id].get("streak", 0) + 1
-        quiz["scores"][user_id]["streak"] = current_streak
+        # Bumping the epoch implicitly resets everyone else's streak
+        quiz.streak_epoch += 1
+        if entry.streak_epoch == quiz.streak_epoch - 1:
+            current_streak = entry.streak + 1
+        else:
+            current_streak = 1
+        entry.streak = current_streak
+        entry.streak_epoch = quiz.streak_epoch
         streak_bonus = (current_streak - 1) * STREAK_BONUS_PER_LEVEL
         
         points_earned = POINTS_CORRECT + speed_bonus + streak_bonus
-        quiz["scores"][user_id]["points"] += points_earned
+        entry.points += points_earned
 
         # Announce winner and wake up the main loop
         await update.message.reply_text(
             f"🏆 Correct, *{username}*! You were first!\n"
             f"The answer was *{correct_answer}*.\n\n"
-            f"+{points_earned} points! (Total: {quiz['scores'][user_id]['points']})",
+            f"+{points_earned} points! (Total: {entry.points})",
             parse_mode=ParseMode.MARKDOWN
         )
-        
-        # Reset streaks for all other players
-        for p_id in quiz["scores"]:
-            if p_id != user_id:
-                quiz["scores"][p_id]["streak"] = 0
 
-        if quiz.get("current_question_event"):
-            quiz["current_question_event"].set()
+        if not question_future.done():
+            question_future.set_result(user_id)
 
 
 # --- Core Quiz Logic ---
@@ -292,138 +360,157 @@ async def run_quiz_loop(group_id: int, context: ContextTypes.DEFAULT_TYPE):
     quiz = quizzes.get(group_id)
     if not quiz: return
 
-    num_questions = quiz["config"]["num_questions"]
+    num_questions = quiz.config["num_questions"]
 
     for i in range(num_questions):
-        if not quiz.get("active"): break
-
-        quiz.update({
-            "current_q_index": i,
-            "current_question_details": quiz["questions_data"][i],
-            "first_answerer_id": None,
-            "q_start_time": None,
-        })
+        if not quiz.active: break
+
+        quiz.current_q_index = i
+        quiz.current_question_details = quiz.questions_data[i]
+        quiz.first_answerer_id = None
+        quiz.q_start_time = None
+        quiz.current_question_future = asyncio.get_running_loop().create_future()
         
-        question_details = quiz["current_question_details"]
+        question_details = quiz.current_question_details
 
         await context.bot.send_message(
             chat_id=group_id,
 text=f"*--- Question {i + 1}/{num_questions} ---*\n\n*{question_details['text']}*",
             parse_mode=ParseMode.MARKDOWN
         )
-        quiz["q_start_time"] = time.time()
-        quiz["current_question_event"].clear()
-
-        # Start a timeout task for the current question
-        context.application.create_task(
-            end_question_by_timeout(group_id, context, i, DEFAULT_TIMEOUT_PER_Q)
-        )
-
-        await quiz["current_question_event"].wait() # Wait for timeout or correct answer
-
-        if not quiz.get("active"):
-            logger.info(f"Quiz {group_id} stopped during question loop.")
+        quiz.q_start_time = time.time()
+        logger.debug("Quiz %d question %d/%d: %s (answer %d)", group_id, i + 1, num_questions,
+                     question_details['text'], question_details['answer'])
+
+        try:
+            # Wait for a correct answer (or a stop request) until the question times out
+            await asyncio.wait_for(quiz.current_question_future, DEFAULT_TIMEOUT_PER_Q)
+        except asyncio.TimeoutError:
+            # A winner may have been locked in while their reply was still being sent
+            if quiz.active and quiz.first_answerer_id is None:
+                await announce_timeout(group_id, context, quiz)
+
+        if not quiz.active:
+            logger.info("Quiz %d stopped during question loop.", group_id)
             break
 
         if i < num_questions - 1:
-            await show_leaderboard(group_id, context, mid_quiz=True)
-            await context.bot.send_message(chat_id=group_id, text="Next question in 5 seconds...")
+            # Send the leaderboard and the countdown as a single message
+            text = "Next question in 5 seconds..."
+            leaderboard_text = await show_leaderboard(group_id, context, mid_quiz=True, send=False)
+            if leaderboard_text:
+                text = f"{leaderboard_text}\n\n{text}"
+            await context.bot.send_message(chat_id=group_id, text=text, parse_mode=ParseMode.MARKDOWN)
             await asyncio.sleep(5)
 
-    if quiz.get("active"):
-        quiz["active"] = False
+    if quiz.active:
+        quiz.active = False
         await context.bot.send_message(chat_id=group_id, text="🏁 Quiz Finished! 🏁")
         await show_leaderboard(group_id, context, final=True)
-        if group_id in quizzes:
-            del quizzes[group_id]
+        quizzes.pop(group_id, None)
 
 
-async def end_question_by_timeout(group_id: int, context: ContextTypes.DEFAULT_TYPE, q_index: int, timeout: int):
-    """Ends the current question if the timeout is reached."""
-    await asyncio.sleep(timeout)
-    quiz = quizzes.get(group_id)
-
-    # Check if this timeout is still relevant (i.e., question wasn't already answered or stopped)
-    if (not quiz or not quiz.get("active") or
-            quiz.get("current_q_index") != q_index or
-            quiz.get("first_answerer_id") is not None):
-        return
-
+async def announce_timeout(group_id: int, context: ContextTypes.DEFAULT_TYPE, quiz: Quiz):
+    """Announces that nobody answered the current question in time."""
     # Reset all player streaks since no one answered
-    for player_data in quiz["scores"].values():
-        player_data["streak"] = 0
+    quiz.streak_epoch += 1
 
     await context.bot.send_message(
         chat_id=group_id,
-        text=f"⏱ Time's up! No one answered correctly.\nThe correct answer was: *{quiz['current_question_details']['answer']}*",
+        text=f"⏱ Time's up! No one answered correctly.\nThe correct answer was: *{quiz.current_question_details['answer']}*",
         parse_mode=ParseMode.MARKDOWN
     )
-    
-    if quiz.get("current_question_event"):
-        quiz["current_question_event"].set()
 
 
-async def show_leaderboard(group_id: int, context: ContextTypes.DEFAULT_TYPE, mid_quiz: bool = False, final: bool = False):
-    """Displays the current or final scores."""
+async def show_leaderboard(group_id: int, context: ContextTypes.DEFAULT_TYPE, mid_quiz: bool = False, final: bool = False, send: bool = True) -> str | None:
+    """Displays the current or final scores and returns the leaderboard text.
+
+    With send=False nothing is posted, so the caller can merge the text into its own message.
+    """
     quiz = quizzes.get(group_id)
-    if not quiz or not quiz.get("scores"):
-        if final:
+    if not quiz or not quiz.scores:
+        if final and send:
             await context.bot.send_message(chat_id=group_id, text="The quiz ended, but no scores were recorded!")
-        return
+        return None
 
-    sorted_scores = sorted(quiz["scores"].items(), key=lambda item: item[1]["points"], reverse=True)
+    top_scores = heapq.nlargest(10, quiz.scores.items(), key=lambda item: item[1].points)
     title = "📊 Current Leaderboard" if mid_quiz else "🏆 Final Leaderboard"
-    text = f"{title}:\n"
-    placing_emojis = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = [f"{title}:"]
 
-    for i, (user_id, data) in enumerate(sorted_scores[:10], 1): # Show top 10
-        emoji = placing_emojis.get(i, f" {i}.")
-        streak_icon = f"🔥x{data['streak']}" if data['streak'] > 1 else ""
-        text += f"{emoji} *{data['username']}*: {data['points']} pts {streak_icon}\n"
+    for i, (user_id, data) in enumerate(top_scores, 1): # Show top 10
+        emoji = PLACING_EMOJIS[i - 1] if i <= len(PLACING_EMOJIS) else f" {i}."
+        streak = _effective_streak(quiz, data)
+        streak_icon = f"🔥x{streak}" if streak > 1 else ""
+        lines.append(f"{emoji} *{data.username}*: {data.points} pts {streak_icon}")
+
+    if not top_scores:
+        lines.append("No scores recorded yet.")
+    text = "\n".join(lines)
+
+    if not send:
+        return text
 
-    if not sorted_scores:
-        text += "No scores recorded yet."
-        
     await context.bot.send_message(chat_id=group_id, text=text, parse_mode=ParseMode.MARKDOWN)
     
-    if final and sorted_scores:
-        winner_name = sorted_scores[0][1]['username']
+    if final and top_scores:
+        winner_name = top_scores[0][1].username
         cheering_quote = random.choice(CHEERING_QUOTES)
         await context.bot.send_message(
             chat_id=group_id,
             text=f"🎉 Congratulations to our grand winner, *{winner_name}*! 🎉\n\n_{cheering_quote}_",
             parse_mode=ParseMode.MARKDOWN
         )
+    return text
+
+
+def _effective_streak(quiz: Quiz, player_data: PlayerScore) -> int:
+    """Returns a player's streak, or 0 if it was broken by a later question."""
+    if player_data.streak_epoch == quiz.streak_epoch:
+        return player_data.streak
+    return 0
 
 
 async def _is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Helper to check if a user is an admin in the chat."""
     if update.effective_chat.type == 'private':
         return True
+    key = (update.effective_chat.id, update.effective_user.id)
+    cached = _admin_cache.get(key)
+    if cached and time.time() - cached[0] < ADMIN_CACHE_TTL:
+        return cached[1]
     try:
-        member = await context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
-        return member.status in [member.ADMINISTRATOR, member.OWNER]
+        member = await context.bot.get_chat_member(*key)
+        is_admin = member.status in [member.ADMINISTRATOR, member.OWNER]
+        if len(_admin_cache) >= ADMIN_CACHE_MAX_SIZE:
+            _admin_cache.clear()
+        _admin_cache[key] = (time.time(), is_admin)
+        return is_admin
     except Exception as e:
-        logger.error(f"Error checking admin status: {e}")
+        logger.error("Error checking admin status: %s", e)
         return False
 
 
 # --- Main Bot Setup ---
 if __name__ == '__main__':
-    TOKEN = "7276833801:AAEucg6nOZHCV4tDmYM8G1r0g5vjgFvcK_Y" # Replace with your bot's token
+    load_dotenv()
+    TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 
     if not TOKEN or len(TOKEN.split(':')) != 2:
-        print("ERROR: Invalid Telegram Bot Token.")
+        print("ERROR: Invalid Telegram Bot Token. Set TELEGRAM_BOT_TOKEN in the environment or a .env file.")
         exit(1)
 
-    app = ApplicationBuilder().token(TOKEN).build()
+    # Keep a pool of HTTP/2 connections alive so API calls reuse the TLS session.
+    # Long polling gets its own request object so it never ties up the shared pool.
+    request = HTTPXRequest(connection_pool_size=32, http_version="2", read_timeout=15, write_timeout=15)
+    get_updates_request = HTTPXRequest(http_version="2", read_timeout=15, write_timeout=15)
+    app = ApplicationBuilder().token(TOKEN).request(request).get_updates_request(get_updates_request).build()
 
     # Add handlers
     app.add_handler(CommandHandler("quiz", quiz_command))
     app.add_handler(CommandHandler("start", quiz_command)) # Alias for /quiz
     app.add_handler(CommandHandler("stopquiz", stop_quiz))
     app.add_handler(CallbackQueryHandler(handle_config_callback, pattern="^config:"))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_answer))
+    app.add_handler(MessageHandler(filters.Regex(r'^\s*-?\d{1,6}\s*$'), handle_text_answer))
     
     logger.info("Bot is starting...")
     app.run_polling()